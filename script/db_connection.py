@@ -1,22 +1,43 @@
 import os
-import sys
+import threading
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
 
 import psycopg2
+import psycopg2.pool
 
-def _get_env(name: str, default: str | None = None) -> str:
-    """Get environment variable with optional default."""
-    value = os.environ.get(name, default)
-    if value is None:
-        print(f"ERROR: Missing environment variable {name}")
-        sys.exit(1)
-    return value
+# Connection settings, read from the environment once at import time
+_CFG = dict(
+    dbname=os.environ.get("POSTGRES_DB"),
+    user=os.environ.get("POSTGRES_USER"),
+    password=os.environ.get("POSTGRES_PASSWORD"),
+    host=os.environ.get("POSTGRES_HOST", "localhost"),
+    port=int(os.environ.get("POSTGRES_PORT", "5432")),
+    # Set the default schema to dbo at connect time
+    options="-c search_path=dbo,public",
+)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool():
+    """Create the shared connection pool on first use."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = psycopg2.pool.ThreadedConnectionPool(1, 8, **_CFG)
+    return _POOL
 
 
 def get_connection():
     """
-    Get database connection using environment variables.
+    Borrow a database connection from the shared pool.
+    Return it with release_connection() when done.
+    
+    Settings are read from these environment variables when this module is imported.
     
     Required environment variables:
     - POSTGRES_USER (or defaults to admin)
@@ -27,29 +48,18 @@ def get_connection():
     - POSTGRES_HOST (default: localhost)
     - POSTGRES_PORT (default: 5432)
     """
-    user = os.environ.get("POSTGRES_USER")
-    password = os.environ.get("POSTGRES_PASSWORD")
-    database = os.environ.get("POSTGRES_DB")
-    host = os.environ.get("POSTGRES_HOST", "localhost")
-    port = int(os.environ.get("POSTGRES_PORT", "5432"))
-    
-    conn = psycopg2.connect(
-        dbname=database, 
-        user=user, 
-        password=password, 
-        host=host, 
-        port=port
-    )
-    
-    # Set the default schema to dbo
-    with conn.cursor() as cur:
-        cur.execute("SET search_path TO dbo, public;")
-    conn.commit()
-    
-    return conn
+    return _get_pool().getconn()
+
+
+def release_connection(conn) -> None:
+    """Return a connection obtained from get_connection() to the pool."""
+    _get_pool().putconn(conn)
 
 
-def parse_decimal(value: str | None, default: Decimal = Decimal("0")) -> Decimal:
+_DEC_ZERO = Decimal("0")
+
+
+def parse_decimal(value: str | None, default: Decimal | None = _DEC_ZERO) -> Decimal | None:
     """
     Parse string to Decimal, handling common formatting.
     
@@ -58,13 +68,15 @@ def parse_decimal(value: str | None, default: Decimal = Decimal("0")) -> Decimal
         default: Default value if parsing fails
         
     Returns:
-        Decimal value
+        Decimal value, or default if value is missing or not a number
     """
-    if value is None or value == "":
-        return default
+    if not isinstance(value, str):
+        if value is None:
+            return default
+        value = str(value)
     try:
-        # Remove common formatting artifacts like commas
-        cleaned = str(value).strip().replace(",", "")
-        return Decimal(cleaned) if cleaned != "" else default
-    except (InvalidOperation, AttributeError):
+        # Decimal() ignores surrounding whitespace itself, so only thousands
+        # separators need removing. Empty strings raise InvalidOperation.
+        return Decimal(value.replace(",", "") if "," in value else value)
+    except InvalidOperation:
         return default
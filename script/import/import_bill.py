@@ -2,6 +2,7 @@ import os
 import sys
 import argparse
 import csv
+import io
 from decimal import Decimal
 from datetime import date
 
@@ -9,23 +10,43 @@ import psycopg2
 
 # Import shared database utilities
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connection import get_connection, parse_decimal
+from db_connection import get_connection, release_connection, parse_decimal
+
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_field(value) -> str:
+    """Format a value for COPY's text format (tab-delimited, \\N for NULL)."""
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
 
 
 def read_bill_csv(path: str):
-    required_cols = {"product_name", "quantity", "product_price", "tax_amount", "total"}
-    rows = []
+    """
+    Read bill CSV file, yielding one
+    (product_name, quantity, product_price, tax_amount, total) tuple per row.
+    """
+    required_cols = ("product_name", "quantity", "product_price", "tax_amount", "total")
     with open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        if not reader.fieldnames:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader, [])]
+        if not header:
             raise ValueError("CSV has no header row")
-        header = {h.strip() for h in reader.fieldnames}
-        missing = required_cols - header
+        missing = set(required_cols) - set(header)
         if missing:
             raise ValueError(f"CSV missing required columns: {', '.join(sorted(missing))}")
-        for r in reader:
-            rows.append({k: (v.strip() if isinstance(v, str) else v) for k, v in r.items()})
-    return rows
+        idx = {h: i for i, h in enumerate(header)}
+        pn_i, q_i, pp_i, tx_i, tot_i = (idx[c] for c in required_cols)
+        width = len(header)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            # Decimal() ignores surrounding whitespace in the numeric fields
+            yield row[pn_i].strip(), row[q_i], row[pp_i], row[tx_i], row[tot_i]
 
 
 def import_bill(
@@ -38,30 +59,22 @@ def import_bill(
     bill_date: date | None,
     source: str | None,
 ):
-    items = read_bill_csv(csv_path)
-
     subtotal = Decimal("0")
     tax_sum = Decimal("0")
 
-    # Prepare line items
-    prepared_items = []
-    for r in items:
-        product_name = r.get("product_name")
-        quantity = parse_decimal(r.get("quantity"))
-        unit_price = parse_decimal(r.get("product_price"))
-        tax_amount = parse_decimal(r.get("tax_amount"))
-        line_total = parse_decimal(r.get("total"))
+    # Read, parse and format line items in one pass. Each entry is a COPY
+    # text-format row for the _stage_items staging table.
+    item_rows = []
+    for product_name, quantity_str, price_str, tax_str, total_str in read_bill_csv(csv_path):
+        quantity = parse_decimal(quantity_str)
+        unit_price = parse_decimal(price_str)
 
         subtotal += (quantity * unit_price)
-        tax_sum += tax_amount
-
-        prepared_items.append(
-            {
-                "product_name": product_name,
-                "quantity": quantity,
-                "unit_price": unit_price,
-                "line_total": line_total,
-            }
+        tax_sum += parse_decimal(tax_str)
+
+        item_rows.append(
+            "%s\t%s\t%s\t%s\n"
+            % (_copy_field(product_name), quantity, unit_price, parse_decimal(total_str))
         )
 
     total_amount = subtotal + tax_sum + shipping_amount
@@ -70,6 +83,20 @@ def import_bill(
     try:
         with conn:
             with conn.cursor() as cur:
+                # Land items in a session-local staging table first; it is
+                # not WAL-logged and is dropped when the transaction commits
+                cur.execute(
+                    """
+                    CREATE TEMP TABLE _stage_items ON COMMIT DROP AS
+                    SELECT product_name, quantity, unit_price, line_total
+                    FROM bill_item WITH NO DATA
+                    """
+                )
+                cur.copy_expert(
+                    "COPY _stage_items (product_name, quantity, unit_price, line_total) FROM STDIN",
+                    io.StringIO("".join(item_rows)),
+                )
+
                 # Insert bill header
                 cur.execute(
                     """
@@ -94,30 +121,23 @@ def import_bill(
                 )
                 bill_id = cur.fetchone()[0]
 
-                # Insert bill items
-                for it in prepared_items:
-                    cur.execute(
-                        """
-                        INSERT INTO bill_item (
-                            bill_id, product_id, product_name, quantity, unit, unit_price, line_total
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        (
-                            bill_id,
-                            None,  # product_id unknown at import time
-                            it["product_name"],
-                            it["quantity"],
-                            None,  # unit unknown in this CSV
-                            it["unit_price"],
-                            it["line_total"],
-                        ),
+                # Move staged items into bill_item server-side
+                cur.execute(
+                    """
+                    INSERT INTO bill_item (
+                        bill_id, product_id, product_name, quantity, unit, unit_price, line_total
                     )
+                    SELECT %s, NULL, product_name, quantity, NULL, unit_price, line_total
+                    FROM _stage_items
+                    """,
+                    (bill_id,),
+                )
         print(
             "Imported bill with %d item(s). Subtotal=%s Tax=%s Shipping=%s Total=%s"
-            % (len(prepared_items), str(subtotal), str(tax_sum), str(shipping_amount), str(total_amount))
+            % (len(item_rows), str(subtotal), str(tax_sum), str(shipping_amount), str(total_amount))
         )
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 def main():
@@ -1,5 +1,4 @@
 import os
-from re import A
 import sys
 import argparse
 import csv
@@ -16,7 +15,17 @@ load_dotenv()
 
 # Import shared database utilities
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_connection import get_connection, parse_decimal
+from db_connection import get_connection, release_connection, parse_decimal
+
+
+def _cell(row: List[str], index: Optional[int]) -> Optional[str]:
+    """
+    Return the stripped value at index, or None for missing columns and empty cells.
+    """
+    if index is None or index >= len(row):
+        return None
+    value = row[index].strip()
+    return value if value != "" else None
 
 
 def read_product_csv(csv_path: str) -> List[Dict]:
@@ -28,114 +37,134 @@ def read_product_csv(csv_path: str) -> List[Dict]:
     rows = []
     
     with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        if not reader.fieldnames:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader, [])]
+        if not header:
             raise ValueError("CSV has no header row")
         
-        header = {h.strip() for h in reader.fieldnames}
-        missing = required_cols - header
+        missing = required_cols - set(header)
         if missing:
             raise ValueError(f"CSV missing required columns: {', '.join(sorted(missing))}")
         
-        for r in reader:
-            # Clean and prepare row data
-            row_data = {}
-            for k, v in r.items():
-                key = k.strip()
-                value = v.strip() if isinstance(v, str) else v
-                row_data[key] = value if value != "" else None
+        # Resolve column positions once instead of building a dict per row
+        idx = {h: i for i, h in enumerate(header)}
+        id_i = idx["product_id"]
+        name_i = idx["product_name"]
+        source_i = idx.get("source")
+        unit_i = idx.get("unit")
+        cost_i = idx.get("cost_per_unit")
+        
+        for row in reader:
+            if not row:
+                continue
             
-            # Validate product_id
+            # Validate product_id (int() ignores surrounding whitespace)
+            raw_id = row[id_i] if id_i < len(row) else None
             try:
-                row_data["product_id"] = int(row_data["product_id"])
+                product_id = int(raw_id)
             except (ValueError, TypeError):
-                print(f"WARNING: Invalid product_id '{row_data.get('product_id')}', skipping row")
+                print(f"WARNING: Invalid product_id '{raw_id}', skipping row")
                 continue
             
-            # Parse cost_per_unit if present
-            if "cost_per_unit" in row_data and row_data["cost_per_unit"]:
-                row_data["cost_per_unit"] = parse_decimal(row_data["cost_per_unit"])
+            # Parse cost_per_unit if present (blank cells mean no price)
+            cost_per_unit = None
+            if cost_i is not None and cost_i < len(row):
+                raw_cost = row[cost_i]
+                if raw_cost and not raw_cost.isspace():
+                    cost_per_unit = parse_decimal(raw_cost)
             
-            rows.append(row_data)
+            rows.append({
+                "product_id": product_id,
+                "product_name": _cell(row, name_i),
+                "source": _cell(row, source_i),
+                "unit": _cell(row, unit_i),
+                "cost_per_unit": cost_per_unit,
+            })
     
     return rows
 
 
-def upsert_product(conn, product_data: Dict) -> None:
+def upsert_products(conn, products: List[Dict]) -> None:
     """
-    Insert or update product in the product table.
+    Insert or update all products in the product table with a single statement.
     """
+    # ON CONFLICT cannot touch the same row twice in one statement, so keep
+    # only the last row per product_id (same result as upserting in order).
+    rows = {
+        p["product_id"]: (p["product_id"], p["product_name"], p.get("source"), p.get("unit"))
+        for p in products
+    }
     with conn.cursor() as cur:
-        # Use ON CONFLICT to handle upserts
-        cur.execute("""
+        execute_values(cur, """
             INSERT INTO dbo.product (product_id, product_name, source, unit)
-            VALUES (%(product_id)s, %(product_name)s, %(source)s, %(unit)s)
+            VALUES %s
             ON CONFLICT (product_id) DO UPDATE SET
                 product_name = EXCLUDED.product_name,
                 source = EXCLUDED.source,
                 unit = EXCLUDED.unit
-        """, {
-            "product_id": product_data["product_id"],
-            "product_name": product_data["product_name"],
-            "source": product_data.get("source"),
-            "unit": product_data.get("unit")
-        })
+        """, list(rows.values()), page_size=1000)
 
 
-def insert_product_price(conn, product_id: int, cost_per_unit: Decimal, created_when: datetime = None) -> None:
+def insert_product_prices(conn, prices: Dict[int, Decimal], created_when: datetime) -> List[int]:
     """
-    Insert a new product price record.
+    Insert new product price records in batches, or update the price already
+    recorded for a product at the same timestamp.
+    
+    Args:
+        prices: Mapping of product_id to cost_per_unit
+        created_when: Timestamp shared by all records
+        
+    Returns:
+        product_ids whose price record was actually written
     """
-    if created_when is None:
-        created_when = datetime.now()
+    if not prices:
+        return []
     
     with conn.cursor() as cur:
-        # Check if there's already a price for this product at this exact timestamp
-        cur.execute("""
-            SELECT cost_per_unit FROM product_price 
-            WHERE product_id = %s AND created_when = %s
-        """, (product_id, created_when))
-        
-        existing = cur.fetchone()
-        if existing:
-            # Update existing price if different
-            if existing[0] != cost_per_unit:
-                cur.execute("""
-                    UPDATE product_price 
-                    SET cost_per_unit = %s 
-                    WHERE product_id = %s AND created_when = %s
-                """, (cost_per_unit, product_id, created_when))
-                return True
-            return False
-        else:
-            # Insert new price record
-            cur.execute("""
-                INSERT INTO dbo.product_price (product_id, cost_per_unit, created_when)
-                VALUES (%s, %s, %s)
-            """, (product_id, cost_per_unit, created_when))
-            return True
-
-
-def get_latest_product_price(conn, product_id: int) -> Optional[Decimal]:
+        written = execute_values(cur, """
+            INSERT INTO dbo.product_price (product_id, cost_per_unit, created_when)
+            VALUES %s
+            ON CONFLICT (product_id, created_when) DO UPDATE SET
+                cost_per_unit = EXCLUDED.cost_per_unit
+            WHERE product_price.cost_per_unit <> EXCLUDED.cost_per_unit
+            RETURNING product_id
+        """, [(pid, cost, created_when) for pid, cost in prices.items()], page_size=500, fetch=True)
+        return [row[0] for row in written]
+
+
+def get_latest_product_prices(conn, product_ids: List[int]) -> Dict[int, Decimal]:
     """
-    Get the latest price for a product.
+    Get the latest price for each of the given products in a single query.
+    Products without any price record are absent from the result.
     """
     with conn.cursor() as cur:
         cur.execute("""
-            SELECT cost_per_unit FROM product_price 
-            WHERE product_id = %s 
-            ORDER BY created_when DESC 
-            LIMIT 1
-        """, (product_id,))
+            SELECT DISTINCT ON (product_id) product_id, cost_per_unit
+            FROM product_price 
+            WHERE product_id = ANY(%s)
+            ORDER BY product_id, created_when DESC
+        """, (list(product_ids),))
         
-        result = cur.fetchone()
-        return result[0] if result else None
+        return dict(cur.fetchall())
+
+
+_DETAIL_CHUNK_ROWS = 1000
+
+
+def _flush_details(details: List[str]) -> None:
+    """
+    Write buffered per-product messages to stderr in one call.
+    """
+    if details:
+        sys.stderr.write("\n".join(details) + "\n")
+        details.clear()
 
 
 def import_product_csv(
     csv_path: str,
     update_prices: bool = True,
-    price_timestamp: datetime = None
+    price_timestamp: datetime = None,
+    verbose: bool = False
 ) -> None:
     """
     Import products from CSV file.
@@ -144,7 +173,10 @@ def import_product_csv(
         csv_path: Path to CSV file
         update_prices: Whether to update/insert prices if cost_per_unit is provided
         price_timestamp: Timestamp for price records (defaults to now)
+        verbose: Also report each product's price change on stderr
     """
+    # One timestamp for the whole import so every price record shares it
+    price_timestamp = price_timestamp or datetime.now()
     products = read_product_csv(csv_path)
     
     if not products:
@@ -153,56 +185,77 @@ def import_product_csv(
     
     conn = get_connection()
     try:
+        # Commits on success and rolls back on error
         with conn:
             products_updated = 0
             prices_updated = 0
             prices_inserted = 0
+            prices_unchanged = 0
+            details = []
+            
+            # Upsert all products in one round-trip
+            upsert_products(conn, products)
+            
+            latest_prices = {}
+            pending_prices = {}
+            price_rows = []
+            if update_prices:
+                latest_prices = get_latest_product_prices(
+                    conn, [p["product_id"] for p in products]
+                )
             
             for product in products:
                 product_id = product["product_id"]
-                
-                # Upsert product
-                upsert_product(conn, product)
                 products_updated += 1
                 
                 # Handle price update if cost_per_unit is provided
-                if update_prices and "cost_per_unit" in product and product["cost_per_unit"] is not None:
+                if update_prices and product["cost_per_unit"] is not None:
                     new_price = product["cost_per_unit"]
                     
                     # Check if price has changed
-                    current_price = get_latest_product_price(conn, product_id)
+                    current_price = latest_prices.get(product_id)
                     
                     if current_price is None or current_price != new_price:
-                        # Insert new price record
-                        price_updated = insert_product_price(
-                            conn, 
-                            product_id, 
-                            new_price, 
-                            price_timestamp
-                        )
-                        if price_updated:
-                            if current_price is None:
-                                prices_inserted += 1
-                                print(f"  Product {product_id}: New price {new_price}")
-                            else:
-                                prices_updated += 1
-                                print(f"  Product {product_id}: Price updated from {current_price} to {new_price}")
+                        # Queue new price record; a later row for the same
+                        # product overrides it, as the per-row upsert did
+                        pending_prices[product_id] = new_price
+                        latest_prices[product_id] = new_price
+                    price_rows.append((product_id, current_price, new_price))
+            
+            # Write all changed prices at once
+            written = set(insert_product_prices(conn, pending_prices, price_timestamp))
+            
+            # Report in CSV order and count only price rows actually written;
+            # a product repeated in the CSV is reported once, with its last price
+            for product_id, current_price, new_price in price_rows:
+                if current_price is not None and current_price == new_price:
+                    prices_unchanged += 1
+                    if verbose:
+                        details.append(f"  Product {product_id}: Price unchanged ({new_price})")
+                elif product_id in written:
+                    written.discard(product_id)
+                    new_price = pending_prices[product_id]
+                    if current_price is None:
+                        prices_inserted += 1
+                        if verbose:
+                            details.append(f"  Product {product_id}: New price {new_price}")
                     else:
-                        print(f"  Product {product_id}: Price unchanged ({new_price})")
+                        prices_updated += 1
+                        if verbose:
+                            details.append(f"  Product {product_id}: Price updated from {current_price} to {new_price}")
+                
+                if len(details) >= _DETAIL_CHUNK_ROWS:
+                    _flush_details(details)
             
-            conn.commit()
+            _flush_details(details)
             
             print(f"\nImport Summary:")
             print(f"  Products processed: {products_updated}")
             print(f"  New prices inserted: {prices_inserted}")
             print(f"  Prices updated: {prices_updated}")
-            
-    except Exception as e:
-        conn.rollback()
-        print(f"ERROR during import: {e}")
-        raise
+            print(f"  Prices unchanged: {prices_unchanged}")
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 def main():
@@ -214,6 +267,11 @@ def main():
         required=True, 
         help="Path to CSV file with columns: product_id, product_name, source, unit, cost_per_unit (optional)"
     )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Report the price change of every product (written to stderr)"
+    )
     
     args = parser.parse_args()
     
@@ -221,7 +279,8 @@ def main():
         import_product_csv(
             csv_path=args.file,
             update_prices=True,
-            price_timestamp=datetime.now()
+            price_timestamp=datetime.now(),
+            verbose=args.verbose
         )
         print("Import completed successfully!")
     except Exception as e: